@@ -0,0 +1,301 @@
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+from converter import DEFAULT_CHUNK_SIZE, breaker, model_stats, process_large_text, scheduler
+
+# Lightweight HTTP front end around the same engine the Streamlit page uses.
+#
+#   POST /convert        {"text": "..."}            -> {"text": "...", "degraded": false}
+#   POST /batch          {"texts": ["...", ...]}    -> 202 {"job_id": "..."}
+#   GET  /jobs/<job_id>                             -> job status and results
+#   GET  /metrics                                   -> counters and queue depth
+#
+# Conversions run on a fixed worker pool fed by a bounded queue; when the
+# queue is full the request is rejected with 429 instead of piling up.
+# Model calls are then shared fairly per client (X-Client-Id header, or the
+# client address) with the Streamlit sessions running in the same process.
+
+MAX_REQUEST_BYTES = int(os.getenv("MATH_ENHANCER_MAX_REQUEST_BYTES", str(5 * 1024 * 1024)))
+WORKERS = int(os.getenv("MATH_ENHANCER_WORKERS", str(scheduler.max_concurrency)))
+QUEUE_SIZE = int(os.getenv("MATH_ENHANCER_QUEUE_SIZE", "32"))
+JOB_TTL = 3600
+
+
+class QueueFull(Exception):
+    pass
+
+
+class WorkerPool:
+    def __init__(self, workers=WORKERS, queue_size=QUEUE_SIZE, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.tasks = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.busy = 0
+        self.metrics = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "degraded": 0,
+            "rejected": 0,
+            "chars_in": 0,
+            "chars_out": 0,
+            "busy_seconds": 0.0,
+        }
+        self.started = time.time()
+        self.threads = [threading.Thread(target=self._run, daemon=True) for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, text, client_id=None):
+        future = Future()
+        try:
+            self.tasks.put_nowait((text, client_id, future))
+        except queue.Full:
+            with self.lock:
+                self.metrics["rejected"] += 1
+            raise QueueFull()
+        with self.lock:
+            self.metrics["submitted"] += 1
+            self.metrics["chars_in"] += len(text)
+        return future
+
+    def _run(self):
+        while True:
+            text, client_id, future = self.tasks.get()
+            if not future.set_running_or_notify_cancel():
+                self.tasks.task_done()
+                continue
+            with self.lock:
+                self.busy += 1
+            start = time.perf_counter()
+            stats = {}
+            try:
+                result = process_large_text(text, chunk_size=self.chunk_size, stats=stats, session_id=client_id)
+            except Exception as exc:
+                with self.lock:
+                    self.metrics["failed"] += 1
+                future.set_exception(exc)
+            else:
+                with self.lock:
+                    self.metrics["completed"] += 1
+                    self.metrics["chars_out"] += len(result)
+                    self.metrics["degraded"] += bool(stats)
+                future.set_result({"text": result, "degraded": bool(stats)})
+            finally:
+                with self.lock:
+                    self.busy -= 1
+                    self.metrics["busy_seconds"] += time.perf_counter() - start
+                self.tasks.task_done()
+
+    def snapshot(self):
+        with self.lock:
+            data = dict(self.metrics)
+            data["busy_workers"] = self.busy
+        data["workers"] = len(self.threads)
+        data["queue_depth"] = self.tasks.qsize()
+        data["queue_capacity"] = self.tasks.maxsize
+        data["uptime_seconds"] = round(time.time() - self.started, 3)
+        data["circuit_breaker"] = breaker.snapshot()
+        data["scheduler"] = scheduler.snapshot()
+        data["key_pool"] = model_stats()
+        return data
+
+
+class JobStore:
+    def __init__(self, ttl=JOB_TTL):
+        self.ttl = ttl
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def create(self, futures):
+        job_id = uuid.uuid4().hex
+        with self.lock:
+            self._expire()
+            self.jobs[job_id] = {"futures": futures, "created": time.time()}
+        return job_id
+
+    def status(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        results = []
+        for future in job["futures"]:
+            if not future.done():
+                results.append({"status": "pending"})
+            elif future.exception() is not None:
+                results.append({"status": "failed", "error": str(future.exception())})
+            else:
+                results.append({"status": "done", **future.result()})
+        done = sum(1 for r in results if r["status"] != "pending")
+        return {
+            "job_id": job_id,
+            "status": "done" if done == len(results) else "running",
+            "completed": done,
+            "total": len(results),
+            "results": results,
+        }
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        for job_id in [k for k, v in self.jobs.items() if v["created"] < cutoff]:
+            del self.jobs[job_id]
+
+
+class ConversionHandler(BaseHTTPRequestHandler):
+    pool = None
+    jobs = None
+    max_request_bytes = MAX_REQUEST_BYTES
+    request_timeout = 300
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._send(200, self.pool.snapshot())
+        elif self.path.startswith("/jobs/"):
+            status = self.jobs.status(self.path[len("/jobs/"):])
+            if status is None:
+                self._send(404, {"error": "unknown job"})
+            else:
+                self._send(200, status)
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path not in ("/convert", "/batch"):
+            self._send(404, {"error": "not found"})
+            return
+        body = self._read_json()
+        if body is None:
+            return
+        try:
+            if self.path == "/convert":
+                text = body.get("text")
+                if not isinstance(text, str):
+                    self._send(400, {"error": "'text' must be a string"})
+                    return
+                future = self.pool.submit(text, self._client_id())
+                try:
+                    self._send(200, future.result(timeout=self.request_timeout))
+                except FutureTimeout:
+                    # Drop it if no worker has picked it up yet
+                    future.cancel()
+                    self._send(504, {"error": f"conversion did not finish within {self.request_timeout}s"})
+                except Exception as exc:
+                    self._send(502, {"error": str(exc)})
+            else:
+                texts = body.get("texts")
+                if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+                    self._send(400, {"error": "'texts' must be a list of strings"})
+                    return
+                # A batch that could never fit must not look like a retryable 429
+                if len(texts) > self.pool.tasks.maxsize:
+                    self._send(413, {
+                        "error": f"batch of {len(texts)} texts exceeds the queue capacity of "
+                                 f"{self.pool.tasks.maxsize}; split it into smaller batches"
+                    })
+                    return
+                # Refuse the whole batch up front rather than accepting half of it.
+                if self.pool.tasks.maxsize - self.pool.tasks.qsize() < len(texts):
+                    with self.pool.lock:
+                        self.pool.metrics["rejected"] += 1
+                    raise QueueFull()
+                futures = []
+                try:
+                    for t in texts:
+                        futures.append(self.pool.submit(t, self._client_id()))
+                except QueueFull:
+                    for future in futures:
+                        future.cancel()
+                    raise
+                job_id = self.jobs.create(futures)
+                self._send(202, {"job_id": job_id, "total": len(futures)})
+        except QueueFull:
+            self._send(429, {"error": "conversion queue is full, retry later"}, {"Retry-After": "1"})
+
+    def _client_id(self):
+        # Model calls are shared fairly per client, like sessions in the UI
+        return "api:" + (self.headers.get("X-Client-Id") or self.client_address[0])
+
+    def _read_json(self):
+        try:
+            length = int(self.headers.get("Content-Length", "0"))
+        except ValueError:
+            length = -1
+        if length < 0:
+            self._send(400, {"error": "invalid Content-Length"})
+            return None
+        if length > self.max_request_bytes:
+            self._send(413, {"error": f"request exceeds {self.max_request_bytes} bytes"})
+            return None
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send(400, {"error": "invalid JSON"})
+            return None
+        if not isinstance(body, dict):
+            self._send(400, {"error": "expected a JSON object"})
+            return None
+        return body
+
+    def _send(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def create_server(host="127.0.0.1", port=8000, workers=WORKERS, queue_size=QUEUE_SIZE,
+                  max_request_bytes=MAX_REQUEST_BYTES, chunk_size=DEFAULT_CHUNK_SIZE):
+    # queue.Queue treats maxsize 0 as unbounded, which would switch off backpressure
+    if queue_size < 1:
+        raise ValueError("queue_size must be at least 1")
+    handler = type("Handler", (ConversionHandler,), {
+        "pool": WorkerPool(workers, queue_size, chunk_size),
+        "jobs": JobStore(),
+        "max_request_bytes": max_request_bytes,
+    })
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="HTTP API for Math Equation Enhancer Pro")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE)
+    parser.add_argument("--max-request-bytes", type=int, default=MAX_REQUEST_BYTES)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--stub", action="store_true", help="use the local stub model instead of Gemini")
+    args = parser.parse_args()
+    if args.queue_size < 1:
+        parser.error("--queue-size must be at least 1")
+    if args.stub:
+        os.environ["MATH_ENHANCER_MODEL"] = "stub"
+    server = create_server(args.host, args.port, args.workers, args.queue_size,
+                           args.max_request_bytes, args.chunk_size)
+    print(f"Serving on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
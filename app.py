@@ -1,13 +1,59 @@
 
 import os
-import re
+from functools import partial
 import streamlit as st
-import google.generativeai as genai
 from dotenv import load_dotenv
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from converter import breaker, process_large_text
+from ingest import SUPPORTED_EXTENSIONS, IngestError, convert_document
+import refine
+from profiler import RerunProfiler, summary_rows
+from result_store import store as result_store
 
 # Load environment variables
 load_dotenv()
 
+# Opt-in rerun profiling (MATH_ENHANCER_PROFILE=1). Visitors can only turn it
+# on with ?profile=1 where the operator allows that (MATH_ENHANCER_PROFILE=query),
+# since it appends to the log file and shows process-wide stats.
+PROFILE_MODE = os.getenv("MATH_ENHANCER_PROFILE", "")
+PROFILE_ENABLED = PROFILE_MODE == "1" or (PROFILE_MODE == "query" and st.query_params.get("profile") == "1")
+
+
+def new_profiler(scope):
+    ctx = get_script_run_ctx()
+    return RerunProfiler(PROFILE_ENABLED, st.session_state, ctx.session_id if ctx else None, scope=scope)
+
+
+def profiled_fragment(func=None, *, run_every=None):
+    # Each area of the page is a fragment, so typing or downloading only reruns
+    # that area. A fragment rerun skips the rest of the script, so it is
+    # profiled as its own run under the fragment's name.
+    if func is None:
+        return partial(profiled_fragment, run_every=run_every)
+
+    def run():
+        global profiler
+        ctx = get_script_run_ctx()
+        if not (ctx and ctx.fragment_ids_this_run):
+            func()
+            return
+        profiler = new_profiler(func.__name__)
+        try:
+            func()
+        finally:
+            profiler.mark(func.__name__)
+            profiler.finish()
+    run.__name__ = func.__name__
+    run.__qualname__ = func.__qualname__
+    return st.fragment(run, run_every=run_every)
+
+
+profiler = new_profiler("app")
+
+# Longer outputs are previewed, not held in full in the output widget's state
+PREVIEW_CHARS = int(os.getenv("MATH_ENHANCER_PREVIEW_CHARS", "5000"))
+
 # Configure page and styling
 st.set_page_config(
     page_title="✨ Math Equation Enhancer Pro",
@@ -23,6 +69,7 @@ st.set_page_config(
         '''
     }
 )
+profiler.mark("page_config")
 
 # Custom CSS styling
 st.markdown("""
@@ -119,31 +166,34 @@ st.markdown("""
         margin-top: 2rem;
         box-shadow: 0 4px 15px rgba(0,0,0,0.1);
     }
-    </style>
-""", unsafe_allow_html=True)
-
-# Configure Google API
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-model = genai.GenerativeModel("gemini-1.5-flash")
 
-# Helper functions (unchanged)
-def clean_equations_with_regex(text):
-    return re.sub(r"\\\((.*?)\\\)", r"$\1$", text)
+    /* Refined Chunk Highlighting */
+    .refined-chunk pre {
+        white-space: pre-wrap;
+        background: #f8f9fa;
+        border-radius: 8px;
+        padding: 0.75rem;
+    }
 
-def get_gemini_response(text):
-    prompt = (
-        "You are a text processor. Your ONLY TASK is to replace ALL inline LaTeX equations formatted as \( ... \) "
-        "with Markdown-style equations $ ... $. Do NOT change any other text. "
-        "Return ONLY the modified text."
-    )
-    response = model.generate_content([prompt, text])
-    processed_text = response.text.strip() if response.text else text
-    return clean_equations_with_regex(processed_text)
+    .refined-chunk mark {
+        background: #f9e79f;
+        border-radius: 3px;
+    }
 
-def process_large_text(text, chunk_size=3000):
-    chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
-    converted_chunks = [get_gemini_response(chunk) for chunk in chunks]
-    return "".join(converted_chunks)
+    /* Degraded Mode Badge */
+    .degraded-badge {
+        display: inline-block;
+        background: linear-gradient(45deg, #e67e22, #d35400);
+        color: white;
+        padding: 0.4rem 1rem;
+        border-radius: 20px;
+        font-weight: bold;
+        margin-bottom: 1rem;
+        box-shadow: 0 4px 10px rgba(0,0,0,0.1);
+    }
+    </style>
+""", unsafe_allow_html=True)
+profiler.mark("css")
 
 # Enhanced App Header
 st.markdown("""
@@ -154,6 +204,7 @@ st.markdown("""
         </p>
     </div>
 """, unsafe_allow_html=True)
+profiler.mark("header")
 
 # Welcome Message
 st.markdown("""
@@ -168,48 +219,197 @@ st.markdown("""
         </ul>
     </div>
 """, unsafe_allow_html=True)
+profiler.mark("welcome")
 
 # Initialize session state
-if "output_text" not in st.session_state:
-    st.session_state.output_text = ""
-
-# Create two columns
-col1, col2 = st.columns(2)
+# Converted documents live in the shared result store; the session only keeps a handle
+if "output_handle" not in st.session_state:
+    st.session_state.output_handle = None
+profiler.mark("session_state")
 
-with col1:
+@profiled_fragment
+def input_column():
     st.markdown('<div class="stHeader"><h3>📝 Input Markdown</h3></div>', unsafe_allow_html=True)
     st.markdown('<div class="markdown-container">Paste your Markdown content with LaTeX equations below 👇:</div>', unsafe_allow_html=True)
     input_text = st.text_area("", height=400, placeholder="Enter your markdown text here...👋")
+    uploaded_file = st.file_uploader(
+        "📂 Or upload a document",
+        type=[extension.lstrip(".") for extension in SUPPORTED_EXTENSIONS],
+        help="Markdown, LaTeX or Jupyter notebooks. Only notebook cells with math are sent for conversion"
+    )
+    instant_preview = st.toggle(
+        "⚡ Instant preview",
+        help="Show a local conversion right away and refine it with AI in the background"
+    )
     st.markdown('</div>', unsafe_allow_html=True)
     
     st.markdown('<div class="button-container">', unsafe_allow_html=True)
     if st.button("🔄 Convert Equations", help="Click to process and convert equations in your markdown"):
-        if input_text:
-            with st.spinner("🔄 Processing equations..."):
-                st.session_state.output_text = process_large_text(input_text)
+        if uploaded_file is None and not input_text:
+            st.warning("⚠️ Please enter some text to convert")
+        elif instant_preview and uploaded_file is None:
+            ctx = get_script_run_ctx()
+            # A new conversion supersedes a refinement that is still running
+            refine.discard(st.session_state.get("refinement_id"))
+            refinement = refine.Refinement(input_text, session_id=ctx.session_id if ctx else None).start()
+            st.session_state.refinement_id = refinement.job_id
+            st.session_state.refined_changes = []
+            st.session_state.output_handle = result_store.put(
+                refinement.text, replaces=st.session_state.output_handle
+            )
+            st.session_state.output_file_name = "enhanced_equations.md"
+            st.session_state.degraded = False
+            profiler.finish()
+            st.rerun()
+        else:
+            refine.discard(st.session_state.pop("refinement_id", None))
+            stats = {}
+            queue_status = st.empty()
+            ctx = get_script_run_ctx()
+            convert = partial(
+                process_large_text,
+                stats=stats,
+                session_id=ctx.session_id if ctx else None,
+                on_wait=lambda position: queue_status.info(
+                    f"⏳ Busy right now: {position} request(s) ahead of you in the queue"
+                ),
+            )
+            try:
+                with st.spinner("🔄 Processing equations..."), profiler.section("convert"):
+                    if uploaded_file is not None:
+                        output_text = convert_document(
+                            uploaded_file.name, uploaded_file.getvalue().decode("utf-8"), convert
+                        )
+                        st.session_state.output_file_name = "enhanced_" + uploaded_file.name
+                    else:
+                        output_text = convert(input_text)
+                        st.session_state.output_file_name = "enhanced_equations.md"
+                st.session_state.output_handle = result_store.put(
+                    output_text, replaces=st.session_state.output_handle
+                )
+                st.session_state.degraded = bool(stats.get("degraded_chunks"))
+                st.session_state.refined_changes = []
+                queue_status.empty()
+            except (IngestError, UnicodeDecodeError) as exc:
+                st.error(f"❌ Could not read {uploaded_file.name}: {exc}")
+            else:
+                # The output lives in other fragments, so refresh the whole page once
+                st.session_state.conversion_done = True
+                profiler.finish()
+                st.rerun()
+    if st.session_state.pop("conversion_done", False):
+        if st.session_state.get("degraded"):
+            st.warning("⚠️ The AI service is unavailable, so a local conversion was used")
+        else:
             st.success("✅ Conversion completed!")
             st.balloons()
-        else:
-            st.warning("⚠️ Please enter some text to convert")
     st.markdown('</div>', unsafe_allow_html=True)
 
-with col2:
+
+@profiled_fragment
+def output_column():
     st.markdown('<div class="stHeader"><h3>✨ Converted Output</h3></div>', unsafe_allow_html=True)
     st.markdown('<div class="markdown-container">Your processed markdown with converted equations 👇:</div>', unsafe_allow_html=True)
-    output_text = st.text_area("", value=st.session_state.output_text, height=400, key="output_area")
+    if st.session_state.get("degraded") or breaker.degraded:
+        st.markdown('<div class="degraded-badge">⚠️ Degraded: local conversion only</div>', unsafe_allow_html=True)
+    output_text = result_store.get(st.session_state.output_handle)
+    if output_text is None and st.session_state.output_handle is not None:
+        st.session_state.output_handle = None
+        st.info("⌛ Your converted document expired from the server. Please convert it again")
+    output_text = output_text or ""
+    if len(output_text) > PREVIEW_CHARS:
+        st.text_area("", value=output_text[:PREVIEW_CHARS], height=400, key="output_area")
+        st.caption(f"✂️ Showing the first {PREVIEW_CHARS:,} of {len(output_text):,} characters. Download for the full document")
+    else:
+        st.text_area("", value=output_text, height=400, key="output_area")
+    show_refined_changes(st.session_state.get("refined_changes", []))
     st.markdown('</div>', unsafe_allow_html=True)
-    
+
+
+@profiled_fragment(run_every=1)
+def refining_output_column():
+    # Polls the background model pass while an instant preview is refined
+    st.markdown('<div class="stHeader"><h3>✨ Converted Output</h3></div>', unsafe_allow_html=True)
+    refinement = refine.get(st.session_state.refinement_id)
+    if refinement is None or refinement.done:
+        if refinement is not None:
+            st.session_state.output_handle = result_store.put(
+                refinement.text, replaces=st.session_state.output_handle
+            )
+            st.session_state.refined_changes = refinement.highlighted_changes()
+            st.session_state.degraded = refinement.degraded
+            st.session_state.conversion_done = True
+            refine.discard(refinement.job_id)
+        del st.session_state.refinement_id
+        profiler.finish()
+        st.rerun()
+    completed, total = refinement.progress()
+    st.progress(completed / total if total else 1.0, text=f"🤖 Refining with AI: {completed} of {total} chunks checked")
+    output_text = refinement.text
+    st.text_area("", value=output_text[:PREVIEW_CHARS], height=400, key="output_area")
+    show_refined_changes(refinement.highlighted_changes())
+
+
+def show_refined_changes(changes):
+    if not changes:
+        return
+    with st.expander(f"🔍 AI refinements ({len(changes)} chunk(s) changed)"):
+        for index, highlighted in changes:
+            st.markdown(
+                f'<div class="refined-chunk"><b>Chunk {index + 1}</b><pre>{highlighted}</pre></div>',
+                unsafe_allow_html=True
+            )
+
+
+def finish_download():
+    st.session_state.pop("download_handle", None)
+    st.session_state.download_done = True
+
+
+@profiled_fragment
+def download_controls():
+    # The download payload is a full copy of the document held by Streamlit's
+    # media file manager, so it is only built on request and released again
+    # after the download; idle tabs keep nothing but the result store handle.
     st.markdown('<div class="button-container">', unsafe_allow_html=True)
-    if st.session_state.output_text:
-        st.download_button(
-            label="📥 Download Converted Markdown",
-            data=st.session_state.output_text,
-            file_name="enhanced_equations.md",
-            mime="text/markdown",
-            help="Download your converted markdown as a .md file"
-        )
+    if st.session_state.pop("download_done", False):
+        # Fragment reruns keep their media files referenced; a full rerun lets it go
+        profiler.finish()
+        st.rerun()
+    handle = st.session_state.output_handle
+    if handle is not None and (
+        st.session_state.get("download_handle") == handle
+        or st.button("📦 Prepare Download", key="prepare_download", help="Get your converted document ready to download")
+    ):
+        output_text = result_store.get(handle)
+        if output_text:
+            st.session_state.download_handle = handle
+            file_name = st.session_state.get("output_file_name", "enhanced_equations.md")
+            st.download_button(
+                label="📥 Download Converted Markdown",
+                data=output_text,
+                file_name=file_name,
+                mime="application/x-ipynb+json" if file_name.endswith(".ipynb") else "text/markdown",
+                help="Download your converted document",
+                on_click=finish_download
+            )
     st.markdown('</div>', unsafe_allow_html=True)
 
+
+col1, col2 = st.columns(2)
+
+with col1:
+    input_column()
+profiler.mark("input_column")
+
+with col2:
+    if "refinement_id" in st.session_state:
+        refining_output_column()
+    else:
+        output_column()
+    download_controls()
+profiler.mark("output_column")
+
 # Enhanced Footer
 st.markdown("""
     <div class="footer">
@@ -220,6 +420,28 @@ st.markdown("""
         </p>
     </div>
 """, unsafe_allow_html=True)
+profiler.mark("footer")
+
+# Profiler debug panel
+profile_stats = profiler.finish()
+if profile_stats:
+    with st.expander("🛠️ Rerun Profiler", expanded=False):
+        st.markdown(
+            f"**Reruns this session:** {profile_stats['reruns']} &nbsp;|&nbsp; "
+            f"**Last:** {profile_stats['last_run']['seconds'] * 1000:.1f} ms &nbsp;|&nbsp; "
+            f"**Mean:** {profile_stats['total_seconds'] / profile_stats['reruns'] * 1000:.1f} ms &nbsp;|&nbsp; "
+            f"**Max:** {profile_stats['max_seconds'] * 1000:.1f} ms"
+        )
+        st.caption("Reruns by scope: " + ", ".join(f"{scope} × {count}" for scope, count in profile_stats["scopes"].items()))
+        st.dataframe(summary_rows(profile_stats), use_container_width=True, hide_index=True)
+        if profiler.log_path:
+            st.caption(f"Each rerun is appended to `{profiler.log_path}`")
+        store_stats = result_store.stats()
+        st.caption(
+            f"Result store: {store_stats['memory_entries']} in memory ({store_stats['memory_bytes']:,} bytes), "
+            f"{store_stats['disk_entries']} on disk ({store_stats['disk_bytes']:,} bytes), "
+            f"{store_stats['expired']} expired, {store_stats['evicted_for_budget']} evicted for budget"
+        )
 
 
 # import os
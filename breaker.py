@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import deque
+
+# Circuit breaker for model calls. Tracks the outcome and latency of recent
+# calls; once too many of them fail or are too slow the circuit opens and
+# callers should fall back immediately. After a cooldown one probe call is
+# let through (half-open): success closes the circuit, failure reopens it.
+# Only the probe's own outcome decides that; calls admitted earlier that
+# finish meanwhile just feed the window.
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class _Permit:
+    __slots__ = ("probe",)
+
+    def __init__(self, probe=False):
+        self.probe = probe
+
+
+class CircuitBreaker:
+    def __init__(self, window=20, min_calls=5, failure_rate=0.5, slow_call_seconds=20.0, cooldown=30.0):
+        self.window = deque(maxlen=window)
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probing = False
+        self.lock = threading.Lock()
+        self.counts = {"calls": 0, "failures": 0, "slow_calls": 0, "rejected": 0, "opened": 0}
+
+    def allow(self):
+        # Returns a permit if a model call may be attempted now, else None.
+        # Hand the permit back to record() or abandon() when the call ends.
+        with self.lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = HALF_OPEN
+                self.probing = False
+            if self.state == CLOSED:
+                return _Permit()
+            if self.state == HALF_OPEN and not self.probing:
+                self.probing = True
+                return _Permit(probe=True)
+            self.counts["rejected"] += 1
+            return None
+
+    def record(self, ok, seconds, permit=None):
+        slow = seconds >= self.slow_call_seconds
+        failed = not ok or slow
+        with self.lock:
+            self.counts["calls"] += 1
+            self.counts["failures"] += not ok
+            self.counts["slow_calls"] += slow
+            if permit is not None and permit.probe and self.state == HALF_OPEN:
+                self.probing = False
+                if failed:
+                    self._open()
+                else:
+                    self.state = CLOSED
+                    self.window.clear()
+                return
+            self.window.append((failed, seconds))
+            if self.state == CLOSED and len(self.window) >= self.min_calls:
+                failures = sum(1 for f, _ in self.window if f)
+                if failures / len(self.window) >= self.failure_rate:
+                    self._open()
+
+    def abandon(self, permit=None):
+        # The call ended without an outcome (e.g. the caller was interrupted);
+        # if it was the half-open probe, the next caller may probe instead.
+        with self.lock:
+            if permit is not None and permit.probe and self.state == HALF_OPEN:
+                self.probing = False
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.counts["opened"] += 1
+
+    @property
+    def degraded(self):
+        return self.state != CLOSED
+
+    def snapshot(self):
+        with self.lock:
+            latencies = sorted(s for _, s in self.window)
+            data = dict(self.counts)
+            data["state"] = self.state
+            data["window_failure_rate"] = (
+                round(sum(1 for f, _ in self.window if f) / len(self.window), 3) if self.window else 0.0
+            )
+        data["window_p50_seconds"] = round(latencies[len(latencies) // 2], 3) if latencies else None
+        data["window_max_seconds"] = round(latencies[-1], 3) if latencies else None
+        return data
@@ -0,0 +1,170 @@
+import json
+import os
+import re
+import time
+import google.generativeai as genai
+from breaker import CircuitBreaker
+from key_pool import DEFAULT_RPM, KeyPool, KeysExhausted
+from scheduler import FairScheduler
+
+PROMPT = (
+    "You are a text processor. Your ONLY TASK is to replace ALL inline LaTeX equations formatted as \\( ... \\) "
+    "with Markdown-style equations $ ... $. Do NOT change any other text. "
+    "Return ONLY the modified text."
+)
+
+# Tuned settings written by tune.py; environment variables still take precedence
+CONFIG_PATH = os.getenv(
+    "MATH_ENHANCER_CONFIG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "enhancer_config.json")
+)
+
+
+def load_config(path=CONFIG_PATH):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+config = load_config()
+
+DEFAULT_CHUNK_SIZE = int(os.getenv("MATH_ENHANCER_CHUNK_SIZE", config.get("chunk_size", 3000)))
+MODEL_TIMEOUT = float(os.getenv("MATH_ENHANCER_MODEL_TIMEOUT", "60"))
+
+# Shared by every caller in the process, so one slow upstream trips it for all
+breaker = CircuitBreaker(
+    slow_call_seconds=float(os.getenv("MATH_ENHANCER_BREAKER_SLOW_SECONDS", "20")),
+    cooldown=float(os.getenv("MATH_ENHANCER_BREAKER_COOLDOWN", "30")),
+)
+
+# Global cap on concurrent model calls, shared fairly between sessions
+scheduler = FairScheduler(int(os.getenv("MATH_ENHANCER_MAX_CONCURRENT_CALLS", config.get("max_concurrent_calls", 8))))
+
+_model = None
+
+
+class StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+# Offline stand-in for the Gemini model: applies the local rewrite after an
+# optional artificial delay, so the pipeline can be exercised without an API key.
+class StubModel:
+    def __init__(self, latency=0.0, latency_per_char=0.0):
+        self.latency = latency
+        self.latency_per_char = latency_per_char
+
+    def generate_content(self, parts, request_options=None):
+        delay = self.latency + self.latency_per_char * len(parts[-1])
+        if delay:
+            time.sleep(delay)
+        return StubResponse(clean_equations_with_regex(parts[-1]))
+
+
+def build_model():
+    # A new model from the environment: MATH_ENHANCER_MODEL=stub (and
+    # optionally MATH_ENHANCER_STUB_LATENCY) runs against the local stub
+    # instead of Gemini, and GOOGLE_API_KEYS takes a comma-separated list of
+    # keys to spread calls over a KeyPool.
+    keys = [key.strip() for key in os.getenv("GOOGLE_API_KEYS", "").split(",") if key.strip()]
+    if os.getenv("MATH_ENHANCER_MODEL") == "stub":
+        return StubModel(float(os.getenv("MATH_ENHANCER_STUB_LATENCY", "0")))
+    if keys:
+        return KeyPool(keys, rpm=int(os.getenv("MATH_ENHANCER_KEY_RPM", str(DEFAULT_RPM))))
+    genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+    return genai.GenerativeModel("gemini-1.5-flash")
+
+
+def get_model():
+    # Built lazily so importing this module never needs an API key.
+    global _model
+    if _model is None:
+        _model = build_model()
+    return _model
+
+
+def set_model(model):
+    global _model
+    _model = model
+
+
+def model_stats():
+    # Per-key state when running on a KeyPool, otherwise None
+    snapshot = getattr(_model, "snapshot", None)
+    return snapshot() if snapshot else None
+
+
+INLINE_MATH = re.compile(r"\\\((.*?)\\\)")
+
+
+def has_inline_math(text):
+    return "\\(" in text
+
+
+def clean_equations_with_regex(text):
+    return INLINE_MATH.sub(r"$\1$", text)
+
+
+def convert_chunk(text, model=None, session_id=None, on_wait=None):
+    # Returns (converted text, degraded). While the circuit is open, or when
+    # the model call fails, the local rewrite is served instead. Model calls
+    # wait for a scheduler slot; on_wait(position) reports the queue position.
+    model = model or get_model()
+    with scheduler.slot(session_id, on_wait):
+        # Asked only once the slot is held, so a caller abandoned while queued
+        # can never be holding the half-open probe
+        permit = breaker.allow()
+        if permit is None:
+            return clean_equations_with_regex(text), True
+        ok = None
+        start = time.perf_counter()
+        try:
+            # Waiting for a key's quota is local, so it stays out of the latency the breaker judges
+            reserve = getattr(model, "reserve", None)
+            target = reserve(MODEL_TIMEOUT) if reserve else model
+            start = time.perf_counter()
+            response = target.generate_content([PROMPT, text], request_options={"timeout": MODEL_TIMEOUT})
+            processed_text = _with_edges_of(text, response.text) if response.text else text
+            ok = True
+        except KeysExhausted:
+            return clean_equations_with_regex(text), True
+        except Exception:
+            ok = False
+            return clean_equations_with_regex(text), True
+        finally:
+            if ok is None:
+                breaker.abandon(permit)
+            else:
+                breaker.record(ok, time.perf_counter() - start, permit)
+    return clean_equations_with_regex(processed_text), False
+
+
+def _with_edges_of(source, text):
+    # The model tends to trim or pad its reply; give it the chunk's own
+    # leading and trailing whitespace so paragraph breaks at chunk boundaries
+    # survive when the chunks are joined back together.
+    lead = source[:len(source) - len(source.lstrip())]
+    trail = source[len(source.rstrip()):] if source.strip() else ""
+    return lead + text.strip() + trail
+
+
+def get_gemini_response(text, model=None, session_id=None):
+    return convert_chunk(text, model, session_id)[0]
+
+
+def iter_chunks(text, chunk_size=DEFAULT_CHUNK_SIZE):
+    for i in range(0, len(text), chunk_size):
+        yield text[i:i + chunk_size]
+
+
+def process_large_text(text, chunk_size=DEFAULT_CHUNK_SIZE, model=None, stats=None, session_id=None, on_wait=None):
+    # stats, if given, collects the number of chunks served by the local fallback.
+    converted_chunks = []
+    for chunk in iter_chunks(text, chunk_size):
+        converted, degraded = convert_chunk(chunk, model, session_id, on_wait)
+        if degraded and stats is not None:
+            stats["degraded_chunks"] = stats.get("degraded_chunks", 0) + 1
+        converted_chunks.append(converted)
+    return "".join(converted_chunks)
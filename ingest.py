@@ -0,0 +1,154 @@
+import argparse
+import json
+import os
+from json.decoder import scanstring
+from dotenv import load_dotenv
+from converter import has_inline_math, process_large_text
+
+# Ingestion for uploaded documents. Markdown and LaTeX files are converted
+# as plain text; Jupyter notebooks only have their math-bearing markdown
+# cells sent through the converter, and the converted sources are spliced
+# back into the original JSON so every other byte of the file is unchanged.
+
+SUPPORTED_EXTENSIONS = (".md", ".markdown", ".tex", ".txt", ".ipynb")
+
+
+class IngestError(ValueError):
+    pass
+
+
+_WHITESPACE = " \t\n\r"
+_decoder = json.JSONDecoder()
+
+
+def _skip_ws(s, i):
+    while i < len(s) and s[i] in _WHITESPACE:
+        i += 1
+    return i
+
+
+def _object_spans(s, i):
+    # Maps each key of the JSON object starting at s[i] to the (start, end)
+    # span of its value, and returns the index just past the closing brace.
+    spans = {}
+    i = _skip_ws(s, i + 1)
+    if s[i] == "}":
+        return spans, i + 1
+    while True:
+        key, i = scanstring(s, i + 1)
+        i = _skip_ws(s, i)
+        i = _skip_ws(s, i + 1)  # past ':'
+        _, end = _decoder.raw_decode(s, i)
+        spans[key] = (i, end)
+        i = _skip_ws(s, end)
+        if s[i] == "}":
+            return spans, i + 1
+        i = _skip_ws(s, i + 1)  # past ','
+
+
+def _array_spans(s, i):
+    spans = []
+    i = _skip_ws(s, i + 1)
+    if s[i] == "]":
+        return spans
+    while True:
+        _, end = _decoder.raw_decode(s, i)
+        spans.append((i, end))
+        i = _skip_ws(s, end)
+        if s[i] == "]":
+            return spans
+        i = _skip_ws(s, i + 1)
+
+
+def _dump_source(text, original, ensure_ascii):
+    # Serializes a cell source in the same shape and layout as the original:
+    # a plain string stays a string, a list of lines keeps its indentation
+    # and line endings.
+    if original.startswith('"'):
+        return json.dumps(text, ensure_ascii=ensure_ascii)
+    lines = [json.dumps(line, ensure_ascii=ensure_ascii) for line in text.splitlines(keepends=True)]
+    if "\n" not in original:
+        return "[" + ", ".join(lines) + "]"
+    if not lines:
+        return "[]"
+    first_item = original[original.index("\n") + 1:]
+    item_indent = first_item[:len(first_item) - len(first_item.lstrip(" \t"))]
+    close_indent = original[original.rindex("\n") + 1:-1]
+    newline = "\r\n" if "\r\n" in original else "\n"
+    return "[" + newline + ("," + newline).join(item_indent + line for line in lines) + newline + close_indent + "]"
+
+
+def convert_notebook(raw, convert=process_large_text):
+    # Returns (converted notebook text, number of cells converted).
+    try:
+        notebook = json.loads(raw)
+    except json.JSONDecodeError as exc:
+        raise IngestError(f"invalid notebook JSON: {exc}") from exc
+    if not isinstance(notebook, dict) or not isinstance(notebook.get("cells"), list):
+        raise IngestError("not a Jupyter notebook: missing 'cells'")
+    # The span walk below assumes this shape, so check it on the parsed copy first
+    for number, cell in enumerate(notebook["cells"], 1):
+        if not isinstance(cell, dict):
+            raise IngestError(f"cell {number} is not a JSON object")
+        source = cell.get("source", "")
+        if not (isinstance(source, str) or (isinstance(source, list) and all(isinstance(s, str) for s in source))):
+            raise IngestError(f"cell {number} has a 'source' that is neither text nor a list of lines")
+    try:
+        top, _ = _object_spans(raw, _skip_ws(raw, 0))
+        cell_spans = _array_spans(raw, top["cells"][0])
+        cells = [_object_spans(raw, cell_start)[0] for cell_start, _ in cell_spans]
+    except (ValueError, IndexError) as exc:
+        raise IngestError(f"could not read notebook layout: {exc}") from exc
+    ensure_ascii = raw.isascii() and "\\u" in raw
+    edits = []
+    for parsed, cell in zip(notebook["cells"], cells):
+        if parsed.get("cell_type") != "markdown" or "source" not in cell:
+            continue
+        source_start, source_end = cell["source"]
+        original = raw[source_start:source_end]
+        source = parsed["source"]
+        text = source if isinstance(source, str) else "".join(source)
+        if not has_inline_math(text):
+            continue
+        converted = convert(text)
+        if converted != text:
+            edits.append((source_start, source_end, _dump_source(converted, original, ensure_ascii)))
+
+    parts = []
+    last = 0
+    for start, stop, replacement in edits:
+        parts.append(raw[last:start])
+        parts.append(replacement)
+        last = stop
+    parts.append(raw[last:])
+    return "".join(parts), len(edits)
+
+
+def convert_document(name, raw, convert=process_large_text):
+    # Converts an uploaded document by file extension and returns the
+    # converted text; text without any inline math never reaches the model.
+    extension = os.path.splitext(name)[1].lower()
+    if extension not in SUPPORTED_EXTENSIONS:
+        raise IngestError(f"unsupported file type: {extension or name}")
+    if extension == ".ipynb":
+        return convert_notebook(raw, convert)[0]
+    if not has_inline_math(raw):
+        return raw
+    return convert(raw)
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Convert equations in a .md, .tex or .ipynb file")
+    parser.add_argument("input")
+    parser.add_argument("output")
+    args = parser.parse_args()
+    with open(args.input, encoding="utf-8", newline="") as f:
+        raw = f.read()
+    converted = convert_document(args.input, raw)
+    with open(args.output, "w", encoding="utf-8", newline="") as f:
+        f.write(converted)
+
+
+if __name__ == "__main__":
+    main()
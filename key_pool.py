@@ -0,0 +1,201 @@
+import threading
+import time
+from collections import deque
+import google.ai.generativelanguage as glm
+import google.generativeai as genai
+from google.api_core.exceptions import InvalidArgument, PermissionDenied, TooManyRequests, Unauthenticated
+
+# Pool of Gemini API keys (or projects). Each call is routed to the healthy
+# key with the most headroom under its requests-per-minute budget; a key
+# that answers 429 backs off on its own while the others keep serving, and a
+# key that keeps being refused (revoked, wrong project) is quarantined.
+# Errors that say nothing about the key (unavailable, deadline exceeded) are
+# the circuit breaker's business and leave the keys alone.
+
+DEFAULT_RPM = 15
+MAX_BACKOFF = 60.0
+QUARANTINE_AFTER = 3  # consecutive key errors
+QUARANTINE_SECONDS = 300.0
+
+
+class KeysExhausted(Exception):
+    # No key frees up within the caller's timeout: a local quota limit, not an upstream failure
+    pass
+
+
+class KeyState:
+    def __init__(self, key, model, rpm):
+        self.label = "…" + key[-4:]
+        self.model = model
+        self.rpm = rpm
+        self.recent = deque()  # start times of calls in the last minute, including in-flight ones
+        self.inflight = 0
+        self.calls = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.consecutive_failures = 0
+        self.quarantined = 0
+        self.backoff = 0.0
+        self.cooldown_until = 0.0
+
+    def headroom(self, now):
+        while self.recent and now - self.recent[0] >= 60:
+            self.recent.popleft()
+        return self.rpm - len(self.recent)
+
+    def snapshot(self, now):
+        return {
+            "key": self.label,
+            "headroom": self.headroom(now),
+            "inflight": self.inflight,
+            "calls": self.calls,
+            "errors": self.errors,
+            "rate_limited": self.rate_limited,
+            "consecutive_failures": self.consecutive_failures,
+            "quarantined": self.quarantined,
+            "cooling_down_seconds": round(max(0.0, self.cooldown_until - now), 3),
+        }
+
+
+def is_key_error(exc):
+    # True for errors caused by the key itself rather than the upstream
+    if isinstance(exc, (PermissionDenied, Unauthenticated)):
+        return True
+    return isinstance(exc, InvalidArgument) and "api key" in str(exc).lower()
+
+
+def gemini_model_for_key(key, model_name="gemini-1.5-flash"):
+    # genai.configure is process-wide, so each key gets its own client
+    model = genai.GenerativeModel(model_name)
+    model._client = glm.GenerativeServiceClient(client_options={"api_key": key})
+    return model
+
+
+class KeyPool:
+    def __init__(self, keys, model_factory=gemini_model_for_key, rpm=DEFAULT_RPM, max_backoff=MAX_BACKOFF,
+                 quarantine_after=QUARANTINE_AFTER, quarantine_seconds=QUARANTINE_SECONDS):
+        if not keys:
+            raise ValueError("KeyPool needs at least one API key")
+        self.keys = [KeyState(key, model_factory(key), rpm) for key in keys]
+        self.max_backoff = max_backoff
+        self.quarantine_after = quarantine_after
+        self.quarantine_seconds = quarantine_seconds
+        self.cond = threading.Condition()
+
+    def acquire(self, exclude=(), timeout=None):
+        # Blocks until some key has headroom, then reserves a call on it.
+        # Returns None once every key is excluded, or right away if no key
+        # can free up within timeout seconds.
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                candidates = [
+                    k for k in self.keys
+                    if k not in exclude and k.cooldown_until <= now and k.headroom(now) > 0
+                ]
+                if candidates:
+                    key = max(candidates, key=lambda k: (k.headroom(now), -k.inflight))
+                    key.inflight += 1
+                    key.recent.append(now)
+                    return key
+                if all(k in exclude for k in self.keys):
+                    return None
+                ready = self._next_available(now, exclude)
+                if deadline is not None and ready > deadline:
+                    return None
+                self.cond.wait(ready - now)
+
+    def _next_available(self, now, exclude):
+        times = []
+        for k in self.keys:
+            if k in exclude:
+                continue
+            ready = k.cooldown_until
+            if k.headroom(now) <= 0 and k.recent:
+                ready = max(ready, k.recent[0] + 60)
+            times.append(max(ready, now + 0.05))
+        return min(times)
+
+    def release(self, key, ok=True, rate_limited=False, key_error=False):
+        # Only key errors count toward quarantine; other failures are just counted.
+        with self.cond:
+            key.inflight -= 1
+            key.calls += 1
+            if rate_limited:
+                key.rate_limited += 1
+                key.backoff = min(self.max_backoff, key.backoff * 2 if key.backoff else 1.0)
+                key.cooldown_until = time.monotonic() + key.backoff
+            elif ok:
+                key.backoff = 0.0
+                key.consecutive_failures = 0
+            else:
+                key.errors += 1
+            if key_error:
+                key.consecutive_failures += 1
+                # Stays counted after the quarantine ends, so one more failure sends it straight back
+                if key.consecutive_failures >= self.quarantine_after:
+                    key.quarantined += 1
+                    key.cooldown_until = max(key.cooldown_until, time.monotonic() + self.quarantine_seconds)
+            self.cond.notify_all()
+
+    def reserve(self, timeout=None):
+        # Takes a key up front and returns a lease for exactly one
+        # generate_content() call on it, so callers can keep the wait for
+        # quota out of their upstream latency measurements. Raises
+        # KeysExhausted if no key frees up within timeout seconds.
+        key = self.acquire(timeout=timeout)
+        if key is None:
+            raise KeysExhausted(f"no API key has headroom within {timeout}s")
+        return _Lease(self, key)
+
+    def generate_content(self, parts, request_options=None):
+        # Same call shape as GenerativeModel; waits for a key for at most the request timeout
+        timeout = (request_options or {}).get("timeout")
+        return self.reserve(timeout).generate_content(parts, request_options)
+
+    def _call(self, key, parts, request_options):
+        # A 429 or a key error is retried on another key that is free right
+        # now, with all attempts sharing the one request timeout. Any other
+        # error, or the last one once no key is left, reaches the caller.
+        timeout = (request_options or {}).get("timeout")
+        deadline = None if timeout is None else time.monotonic() + timeout
+        tried = []
+        while True:
+            try:
+                response = key.model.generate_content(parts, request_options=request_options)
+            except TooManyRequests as exc:
+                self.release(key, ok=False, rate_limited=True)
+                last_error = exc
+            except Exception as exc:
+                key_error = is_key_error(exc)
+                self.release(key, ok=False, key_error=key_error)
+                if not key_error:
+                    raise
+                last_error = exc
+            else:
+                self.release(key)
+                return response
+            tried.append(key)
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise last_error
+                request_options = dict(request_options, timeout=remaining)
+            key = self.acquire(exclude=tried, timeout=0)
+            if key is None:
+                raise last_error
+
+    def snapshot(self):
+        with self.cond:
+            now = time.monotonic()
+            return {"keys": [k.snapshot(now) for k in self.keys]}
+
+
+class _Lease:
+    def __init__(self, pool, key):
+        self.pool = pool
+        self.key = key
+
+    def generate_content(self, parts, request_options=None):
+        return self.pool._call(self.key, parts, request_options)
@@ -0,0 +1,197 @@
+import argparse
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import uuid
+from unittest.mock import MagicMock
+
+# Drives many concurrent simulated sessions through the real app.py with
+# Streamlit's AppTest (load page, paste, Convert, prepare and download)
+# against the stub model, and reports rerun latency, conversion latency
+# percentiles, error rate and process memory for each concurrency level.
+#
+# All sessions run in this one process, like a single Streamlit server, so
+# they share the scheduler, circuit breaker and result store.
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from streamlit import config, logger
+from streamlit.runtime import Runtime
+from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+from streamlit.runtime.media_file_manager import MediaFileManager
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+from streamlit.testing.v1 import AppTest
+from streamlit.testing.v1 import app_test
+from streamlit.testing.v1.local_script_runner import LocalScriptRunner
+import converter
+from tune import sample_documents
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+_session = threading.local()
+_script_cache = ScriptCache()
+
+
+class _SessionScriptRunner(LocalScriptRunner):
+    # AppTest gives every run the same session id and compiles the script
+    # afresh each time. A real server gives each session its own id, which
+    # the fair scheduler keys on, and shares one compiled script; compiling
+    # concurrently on many threads can also fail on CPython 3.11.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._session_id = getattr(_session, "id", self._session_id)
+        self._script_cache = _script_cache
+
+
+def install_shared_runtime():
+    # AppTest installs and tears down a mock Runtime around every run, which
+    # breaks runs happening at the same time; share one for the whole process.
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime.instance = classmethod(lambda cls: runtime)
+    Runtime.exists = classmethod(lambda cls: True)
+    config.set_option("global.appTest", True)
+    logger.set_log_level("error")
+    app_test.LocalScriptRunner = _SessionScriptRunner
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # Peak rather than current RSS, but better than nothing (kB on Linux)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * fraction))], 3)
+
+
+def simulate_session(document, timeout, results):
+    _session.id = "loadtest-" + uuid.uuid4().hex
+    reruns = []
+    try:
+        at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+
+        start = time.perf_counter()
+        at.run()
+        reruns.append(time.perf_counter() - start)
+
+        at.text_area[0].input(document)
+        start = time.perf_counter()
+        at.run()
+        reruns.append(time.perf_counter() - start)
+
+        at.button[0].click()
+        start = time.perf_counter()
+        at.run()
+        conversion = time.perf_counter() - start
+
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+
+        at.button(key="prepare_download").click()
+        start = time.perf_counter()
+        at.run()
+        reruns.append(time.perf_counter() - start)
+        if not at.get("download_button"):
+            raise RuntimeError("no download button after conversion")
+
+        # AppTest cannot click a download button; do what its callback does
+        at.session_state["download_done"] = True
+        start = time.perf_counter()
+        at.run()
+        reruns.append(time.perf_counter() - start)
+    except Exception as exc:
+        results.append({"reruns": reruns, "conversion": None, "error": f"{type(exc).__name__}: {exc}"})
+    else:
+        results.append({"reruns": reruns, "conversion": conversion, "error": None})
+
+
+def run_level(concurrency, documents, timeout):
+    results = []
+    peak = [rss_bytes()]
+    sampling = threading.Event()
+
+    def sample_memory():
+        while not sampling.wait(0.1):
+            peak[0] = max(peak[0], rss_bytes())
+
+    sampler = threading.Thread(target=sample_memory, daemon=True)
+    sampler.start()
+    threads = [
+        threading.Thread(target=simulate_session, args=(documents[i % len(documents)], timeout, results))
+        for i in range(concurrency)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    sampling.set()
+    sampler.join()
+    rss = rss_bytes()
+    peak[0] = max(peak[0], rss)
+
+    reruns = [seconds for r in results for seconds in r["reruns"]]
+    conversions = [r["conversion"] for r in results if r["conversion"] is not None]
+    errors = [r["error"] for r in results if r["error"]]
+    return {
+        "sessions": concurrency,
+        "wall_seconds": round(wall, 3),
+        "rerun_p50_seconds": percentile(reruns, 0.5),
+        "rerun_p95_seconds": percentile(reruns, 0.95),
+        "conversion_p50_seconds": percentile(conversions, 0.5),
+        "conversion_p95_seconds": percentile(conversions, 0.95),
+        "conversion_p99_seconds": percentile(conversions, 0.99),
+        "error_rate": round(len(errors) / concurrency, 4),
+        "errors": sorted(set(errors))[:5],
+        "rss_mb": round(rss / 2**20, 1),
+        "peak_rss_mb": round(peak[0] / 2**20, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test app.py with concurrent simulated sessions")
+    parser.add_argument("--levels", default="1,5,10,25,50", help="comma-separated session counts")
+    parser.add_argument("--stub-latency", type=float, default=0.5, help="stub seconds per model call")
+    parser.add_argument("--stub-latency-per-char", type=float, default=0.0002, help="stub seconds per input character")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds allowed for one script run")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    install_shared_runtime()
+    converter.set_model(converter.StubModel(args.stub_latency, args.stub_latency_per_char))
+    documents = sample_documents()
+
+    results = []
+    for level in [int(v) for v in args.levels.split(",")]:
+        result = run_level(level, documents, args.timeout)
+        results.append(result)
+        print(
+            f"sessions={level:>4}  rerun p50={result['rerun_p50_seconds']}s p95={result['rerun_p95_seconds']}s  "
+            f"convert p50={result['conversion_p50_seconds']}s p95={result['conversion_p95_seconds']}s "
+            f"p99={result['conversion_p99_seconds']}s  errors={result['error_rate']:.1%}  "
+            f"rss={result['rss_mb']}MB peak={result['peak_rss_mb']}MB"
+        )
+        for error in result["errors"]:
+            print(f"    {error}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import argparse
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from converter import DEFAULT_CHUNK_SIZE, convert_chunk, scheduler
+
+# Streaming version of process_large_text: chunks are read, converted and
+# written one at a time, so memory stays bounded by max_pending chunks
+# instead of growing with the size of the document.
+
+# More in-flight chunks than the scheduler admits would only queue
+DEFAULT_CONCURRENCY = scheduler.max_concurrency
+
+
+def read_chunks(source, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Yields the same chunks as iter_chunks, but straight from a file-like object.
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def convert_chunks(chunks, concurrency=DEFAULT_CONCURRENCY, max_pending=None, model=None, stats=None):
+    # Converts chunks on a thread pool and yields results in input order.
+    # At most max_pending chunks are in flight or waiting to be written;
+    # the reader is not pulled again until the oldest one has been yielded.
+    # stats, if given, collects the number of chunks served by the local fallback.
+    max_pending = max(max_pending or concurrency * 2, concurrency, 1)
+    pending = deque()
+
+    def result(future):
+        text, degraded = future.result()
+        if degraded and stats is not None:
+            stats["degraded_chunks"] = stats.get("degraded_chunks", 0) + 1
+        return text
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        try:
+            for chunk in chunks:
+                if len(pending) >= max_pending:
+                    yield result(pending.popleft())
+                pending.append(executor.submit(convert_chunk, chunk, model))
+            while pending:
+                yield result(pending.popleft())
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def write_chunks(results, sink):
+    written = 0
+    for text in results:
+        sink.write(text)
+        written += len(text)
+    sink.flush()
+    return written
+
+
+def process_stream(source, sink, chunk_size=DEFAULT_CHUNK_SIZE, concurrency=DEFAULT_CONCURRENCY,
+                   max_pending=None, model=None, stats=None):
+    # Returns the number of characters written; see convert_chunks for stats.
+    chunks = read_chunks(source, chunk_size)
+    return write_chunks(convert_chunks(chunks, concurrency, max_pending, model, stats), sink)
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Convert a Markdown file chunk by chunk with bounded memory")
+    parser.add_argument("input", help="input file, or - for stdin")
+    parser.add_argument("output", help="output file, or - for stdout")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--max-pending", type=int, default=None,
+                        help="chunks allowed in flight before reading pauses (default: 2x concurrency)")
+    args = parser.parse_args()
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8", newline="")
+    sink = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8", newline="")
+    stats = {}
+    try:
+        process_stream(source, sink, args.chunk_size, args.concurrency, args.max_pending, stats=stats)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+    # A dead upstream must not pass for a finished run
+    if stats.get("degraded_chunks"):
+        raise SystemExit(
+            f"{stats['degraded_chunks']} chunk(s) could not reach the model and got only the local rewrite."
+        )
+
+
+if __name__ == "__main__":
+    main()
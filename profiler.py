@@ -0,0 +1,104 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Opt-in timing of each section of a Streamlit script run. Enabled with
+# MATH_ENHANCER_PROFILE=1, or per page with ?profile=1 when
+# MATH_ENHANCER_PROFILE=query; every rerun is appended as one JSON line to
+# MATH_ENHANCER_PROFILE_LOG.
+
+PROFILE_LOG = os.getenv("MATH_ENHANCER_PROFILE_LOG", "profile_log.jsonl")
+
+_log_lock = threading.Lock()
+
+
+class RerunProfiler:
+    def __init__(self, enabled, session_state=None, session_id=None, scope="app", log_path=PROFILE_LOG):
+        self.enabled = enabled
+        self.session_state = session_state
+        self.session_id = session_id
+        self.scope = scope
+        self.log_path = log_path
+        self.sections = {}
+        self.started = time.perf_counter()
+        self.last_mark = self.started
+        self.finished = False
+
+    def mark(self, name):
+        # Attributes the time since the previous mark to the named section,
+        # so a linear script can be profiled without re-indenting it.
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.sections[name] = self.sections.get(name, 0.0) + now - self.last_mark
+        self.last_mark = now
+
+    @contextmanager
+    def section(self, name):
+        # Times a nested block on its own; the enclosing mark still includes it.
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.sections[name] = self.sections.get(name, 0.0) + time.perf_counter() - start
+
+    def finish(self):
+        # Folds this run into the per-session totals and returns them. Safe to
+        # call twice, e.g. before st.rerun() and again on the way out.
+        if not self.enabled or self.finished:
+            return None
+        self.finished = True
+        duration = time.perf_counter() - self.started
+        stats = self.session_state.setdefault("_profile_stats", {
+            "reruns": 0,
+            "total_seconds": 0.0,
+            "max_seconds": 0.0,
+            "scopes": {},
+            "sections": {},
+        })
+        stats["reruns"] += 1
+        stats["scopes"][self.scope] = stats["scopes"].get(self.scope, 0) + 1
+        stats["total_seconds"] += duration
+        stats["max_seconds"] = max(stats["max_seconds"], duration)
+        for name, seconds in self.sections.items():
+            section = stats["sections"].setdefault(name, {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+            section["count"] += 1
+            section["total_seconds"] += seconds
+            section["max_seconds"] = max(section["max_seconds"], seconds)
+        stats["last_run"] = {"seconds": duration, "sections": dict(self.sections)}
+        self._dump(duration, stats["reruns"])
+        return stats
+
+    def _dump(self, duration, rerun):
+        if not self.log_path:
+            return
+        record = {
+            "time": time.time(),
+            "session_id": self.session_id,
+            "rerun": rerun,
+            "scope": self.scope,
+            "seconds": round(duration, 6),
+            "sections": {name: round(seconds, 6) for name, seconds in self.sections.items()},
+        }
+        with _log_lock:
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+
+
+def summary_rows(stats):
+    # Rows for the debug panel table, slowest section first.
+    rows = []
+    for name, section in stats["sections"].items():
+        rows.append({
+            "section": name,
+            "last (ms)": round(stats["last_run"]["sections"].get(name, 0.0) * 1000, 2),
+            "mean (ms)": round(section["total_seconds"] / section["count"] * 1000, 2),
+            "max (ms)": round(section["max_seconds"] * 1000, 2),
+            "runs": section["count"],
+        })
+    return sorted(rows, key=lambda row: row["mean (ms)"], reverse=True)
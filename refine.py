@@ -0,0 +1,104 @@
+import difflib
+import html
+import threading
+import time
+import uuid
+from converter import DEFAULT_CHUNK_SIZE, clean_equations_with_regex, convert_chunk, iter_chunks
+
+# Instant preview mode: every chunk is first converted locally with the
+# regex rewrite, then a background thread runs the model pass and swaps in
+# only the chunks whose model output differs from the local one.
+
+# Finished refinements nobody collected (e.g. the tab was closed) are dropped after this long
+JOB_TTL = 600
+# A refinement whose progress nobody has polled for this long stops spending model calls
+ABANDON_AFTER = 30
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+class Refinement:
+    def __init__(self, text, chunk_size=DEFAULT_CHUNK_SIZE, session_id=None):
+        self.job_id = uuid.uuid4().hex
+        self.source = list(iter_chunks(text, chunk_size))
+        self.local = [clean_equations_with_regex(chunk) for chunk in self.source]
+        self.chunks = list(self.local)
+        self.session_id = session_id
+        self.changed = []
+        self.completed = 0
+        self.degraded = False
+        self.done = False
+        self.finished_at = None
+        self.last_polled = time.monotonic()
+        self.cancelled = threading.Event()
+        self.lock = threading.Lock()
+
+    def start(self):
+        with _jobs_lock:
+            cutoff = time.monotonic() - JOB_TTL
+            for job_id in [k for k, job in _jobs.items() if job.done and job.finished_at < cutoff]:
+                del _jobs[job_id]
+            _jobs[self.job_id] = self
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def _run(self):
+        try:
+            for index, chunk in enumerate(self.source):
+                if self.cancelled.is_set() or time.monotonic() - self.last_polled > ABANDON_AFTER:
+                    break
+                refined, degraded = convert_chunk(chunk, session_id=self.session_id)
+                with self.lock:
+                    self.completed += 1
+                    self.degraded = self.degraded or degraded
+                    if refined != self.local[index]:
+                        self.chunks[index] = refined
+                        self.changed.append(index)
+        finally:
+            with self.lock:
+                self.done = True
+                self.finished_at = time.monotonic()
+
+    @property
+    def text(self):
+        with self.lock:
+            return "".join(self.chunks)
+
+    def progress(self):
+        # The page polls this while the refinement runs, so it doubles as a heartbeat
+        with self.lock:
+            self.last_polled = time.monotonic()
+            return self.completed, len(self.source)
+
+    def cancel(self):
+        # Stops before the next chunk; the chunk in flight still finishes
+        self.cancelled.set()
+
+    def highlighted_changes(self):
+        # HTML for each swapped-in chunk with the model's edits marked.
+        with self.lock:
+            changed = [(index, self.local[index], self.chunks[index]) for index in sorted(self.changed)]
+        return [(index, _highlight(local, refined)) for index, local, refined in changed]
+
+
+def _highlight(before, after):
+    parts = []
+    matcher = difflib.SequenceMatcher(None, before, after, autojunk=False)
+    for op, _, _, j1, j2 in matcher.get_opcodes():
+        # $ is escaped too so Streamlit's markdown does not render it as math
+        segment = html.escape(after[j1:j2]).replace("$", "&#36;")
+        parts.append(segment if op == "equal" else f"<mark>{segment}</mark>")
+    return "".join(parts)
+
+
+def get(job_id):
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def discard(job_id):
+    with _jobs_lock:
+        job = _jobs.pop(job_id, None)
+    if job is not None:
+        job.cancel()
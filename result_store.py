@@ -0,0 +1,163 @@
+import atexit
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+# Process-wide store for converted documents. Sessions keep only a handle;
+# results over spill_bytes are written to disk, entries idle for longer than
+# ttl are evicted, and the least recently used entries are evicted whenever
+# the total size exceeds max_total_bytes (the newest result is always kept).
+# Each process spills into its own subdirectory of spill_dir, removed at exit;
+# ones left behind by processes that died are swept on the next first spill.
+
+SPILL_BYTES = int(os.getenv("MATH_ENHANCER_SPILL_BYTES", str(64 * 1024)))
+RESULT_TTL = float(os.getenv("MATH_ENHANCER_RESULT_TTL", "1800"))
+MAX_TOTAL_BYTES = int(os.getenv("MATH_ENHANCER_RESULT_BUDGET_BYTES", str(512 * 1024 * 1024)))
+SPILL_DIR = os.getenv("MATH_ENHANCER_SPILL_DIR", os.path.join(tempfile.gettempdir(), "math_enhancer_results"))
+
+
+class ResultStore:
+    def __init__(self, spill_bytes=SPILL_BYTES, ttl=RESULT_TTL, max_total_bytes=MAX_TOTAL_BYTES, spill_dir=SPILL_DIR):
+        self.spill_bytes = spill_bytes
+        self.ttl = ttl
+        self.max_total_bytes = max_total_bytes
+        self.spill_dir = spill_dir
+        self.spill_path = None
+        self.newest = None  # never evicted for budget, even when it alone exceeds it
+        self.entries = OrderedDict()  # handle -> entry dict, least recently used first
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.counts = {"stored": 0, "spilled": 0, "expired": 0, "evicted_for_budget": 0, "misses": 0}
+
+    def put(self, text, replaces=None):
+        data = text.encode("utf-8")
+        handle = uuid.uuid4().hex
+        entry = {"size": len(data), "last_access": time.monotonic(), "text": None, "path": None}
+        if len(data) > self.spill_bytes:
+            entry["path"] = os.path.join(self._spill_path(), handle + ".md")
+            with open(entry["path"], "wb") as f:
+                f.write(data)
+        else:
+            entry["text"] = text
+        with self.lock:
+            if replaces is not None:
+                self._drop(replaces)
+            self.entries[handle] = entry
+            self.total_bytes += entry["size"]
+            self.counts["stored"] += 1
+            self.counts["spilled"] += entry["path"] is not None
+            self.newest = handle
+            self._evict()
+        return handle
+
+    def _spill_path(self):
+        with self.lock:
+            if self.spill_path is None:
+                os.makedirs(self.spill_dir, exist_ok=True)
+                _sweep_stale(self.spill_dir, self.ttl)
+                self.spill_path = tempfile.mkdtemp(prefix=f"{os.getpid()}-", dir=self.spill_dir)
+                atexit.register(shutil.rmtree, self.spill_path, True)
+            return self.spill_path
+
+    def get(self, handle):
+        # Returns the stored text, or None if the handle was evicted.
+        with self.lock:
+            self._evict()
+            entry = self.entries.get(handle)
+            if entry is None:
+                self.counts["misses"] += handle is not None
+                return None
+            entry["last_access"] = time.monotonic()
+            self.entries.move_to_end(handle)
+            if entry["text"] is not None:
+                return entry["text"]
+            path = entry["path"]
+        try:
+            with open(path, "rb") as f:
+                return f.read().decode("utf-8")
+        except FileNotFoundError:
+            return None
+
+    def discard(self, handle):
+        with self.lock:
+            self._drop(handle)
+
+    def _drop(self, handle):
+        entry = self.entries.pop(handle, None)
+        if entry is None:
+            return
+        self.total_bytes -= entry["size"]
+        if entry["path"] is not None:
+            try:
+                os.remove(entry["path"])
+            except FileNotFoundError:
+                pass
+
+    def _evict(self):
+        cutoff = time.monotonic() - self.ttl
+        while self.entries:
+            handle, entry = next(iter(self.entries.items()))
+            if entry["last_access"] >= cutoff:
+                break
+            self._drop(handle)
+            self.counts["expired"] += 1
+        while self.total_bytes > self.max_total_bytes:
+            victim = next((h for h in self.entries if h != self.newest), None)
+            if victim is None:
+                break
+            self._drop(victim)
+            self.counts["evicted_for_budget"] += 1
+
+    def stats(self):
+        with self.lock:
+            memory = [e["size"] for e in self.entries.values() if e["text"] is not None]
+            disk = [e["size"] for e in self.entries.values() if e["path"] is not None]
+            data = dict(self.counts)
+        data.update({
+            "entries": len(memory) + len(disk),
+            "memory_entries": len(memory),
+            "memory_bytes": sum(memory),
+            "disk_entries": len(disk),
+            "disk_bytes": sum(disk),
+            "budget_bytes": self.max_total_bytes,
+        })
+        return data
+
+
+def _sweep_stale(spill_dir, ttl):
+    # Removes spill directories whose process is gone, and loose files from
+    # before results were kept per process.
+    for name in os.listdir(spill_dir):
+        path = os.path.join(spill_dir, name)
+        if os.path.isdir(path):
+            pid = name.split("-", 1)[0]
+            if pid.isdigit() and not _process_alive(int(pid), path, ttl):
+                shutil.rmtree(path, ignore_errors=True)
+        elif name.endswith(".md"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _process_alive(pid, path, ttl):
+    if os.name != "posix":
+        # os.kill(pid, 0) would send CTRL_C_EVENT on Windows; go by age instead
+        try:
+            return time.time() - os.path.getmtime(path) < ttl
+        except OSError:
+            return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+store = ResultStore()
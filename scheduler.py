@@ -0,0 +1,102 @@
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+# Process-wide admission control for model calls. At most max_concurrency
+# calls run at once; waiting calls are granted round-robin across sessions,
+# one chunk at a time, so a session converting a huge document re-queues
+# behind everyone else after each chunk instead of holding the line.
+
+
+class _Ticket:
+    __slots__ = ("granted",)
+
+    def __init__(self):
+        self.granted = False
+
+
+class FairScheduler:
+    def __init__(self, max_concurrency=8):
+        self.max_concurrency = max_concurrency
+        self.active = 0
+        self.waiting = OrderedDict()  # session id -> deque of tickets, in round-robin order
+        self.cond = threading.Condition()
+        self.granted_total = 0
+
+    @contextmanager
+    def slot(self, session_id=None, on_wait=None, poll=0.25):
+        # Blocks until a slot is granted. on_wait(position) is called from the
+        # waiting thread every poll seconds with the number of calls ahead.
+        ticket = _Ticket()
+        with self.cond:
+            self.waiting.setdefault(session_id, deque()).append(ticket)
+            self._grant()
+        try:
+            while True:
+                with self.cond:
+                    if not ticket.granted:
+                        self.cond.wait(poll)
+                    if ticket.granted:
+                        break
+                    position = self._position(session_id, ticket)
+                if on_wait is not None:
+                    on_wait(position)
+        except BaseException:
+            with self.cond:
+                if not ticket.granted:
+                    self._withdraw(session_id, ticket)
+                    raise
+            self.release()
+            raise
+        try:
+            yield
+        finally:
+            self.release()
+
+    def release(self):
+        with self.cond:
+            self.active -= 1
+            self._grant()
+
+    def _grant(self):
+        granted = False
+        while self.active < self.max_concurrency and self.waiting:
+            session_id, tickets = next(iter(self.waiting.items()))
+            ticket = tickets.popleft()
+            del self.waiting[session_id]
+            if tickets:
+                self.waiting[session_id] = tickets
+            ticket.granted = True
+            self.active += 1
+            self.granted_total += 1
+            granted = True
+        if granted:
+            self.cond.notify_all()
+
+    def _withdraw(self, session_id, ticket):
+        tickets = self.waiting.get(session_id)
+        if tickets is not None and ticket in tickets:
+            tickets.remove(ticket)
+            if not tickets:
+                del self.waiting[session_id]
+
+    def _position(self, session_id, ticket):
+        # Number of queued calls that will be granted before this ticket.
+        sessions = list(self.waiting.items())
+        own_index = next(i for i, (sid, _) in enumerate(sessions) if sid == session_id)
+        rounds = list(self.waiting[session_id]).index(ticket)
+        ahead = rounds
+        for i, (sid, tickets) in enumerate(sessions):
+            if sid != session_id:
+                ahead += min(len(tickets), rounds + 1 if i < own_index else rounds)
+        return ahead
+
+    def snapshot(self):
+        with self.cond:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "active": self.active,
+                "waiting_sessions": len(self.waiting),
+                "waiting_calls": sum(len(t) for t in self.waiting.values()),
+                "granted_total": self.granted_total,
+            }
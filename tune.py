@@ -0,0 +1,166 @@
+import argparse
+import json
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from dotenv import load_dotenv
+import converter
+from breaker import CircuitBreaker
+from scheduler import FairScheduler
+
+# Sweeps chunk size and the process-wide cap on concurrent model calls over a
+# set of representative documents, then writes the settings with the best
+# throughput that stay within the latency target and error budget to the
+# config file converter.py loads at startup.
+
+
+def sample_documents(count=6, seed=0):
+    # Synthetic Markdown with inline math, from a short note up to a long chapter.
+    rng = random.Random(seed)
+    sentences = [
+        "The energy is given by \\(E = mc^2\\) for a body at rest.",
+        "Plain prose without any equations keeps the chunk honest.",
+        "For the integral \\(\\int_0^1 x^2 \\, dx = \\frac{1}{3}\\) we use the power rule.",
+        "## A heading in between\n",
+        "Let \\(f(x) = \\sum_{n=0}^{\\infty} a_n x^n\\) be a power series.",
+        "- a bullet point mentioning \\(\\alpha + \\beta\\)\n",
+    ]
+    documents = []
+    for i in range(count):
+        target = 2000 * 3 ** (i % 4)
+        parts = []
+        while sum(len(p) + 1 for p in parts) < target:
+            parts.append(rng.choice(sentences))
+        documents.append(" ".join(parts))
+    return documents
+
+
+def replicate(documents, sessions):
+    # Each session converts its chunks one after another, so a trial needs at
+    # least as many sessions as allowed calls to saturate the cap.
+    return [documents[i % len(documents)] for i in range(max(sessions, len(documents)))]
+
+
+def run_trial(documents, chunk_size, concurrency, make_model=converter.build_model):
+    # Runs every document as its own session, like concurrent users would.
+    # Fresh scheduler, breaker and model each time, so no trial inherits
+    # another's open circuit or key backoffs.
+    converter.set_model(make_model())
+    converter.scheduler = FairScheduler(concurrency)
+    converter.breaker = CircuitBreaker(
+        slow_call_seconds=converter.breaker.slow_call_seconds, cooldown=converter.breaker.cooldown
+    )
+
+    def convert(item):
+        index, text = item
+        stats = {}
+        start = time.perf_counter()
+        converter.process_large_text(text, chunk_size, stats=stats, session_id=f"tune-{index}")
+        return time.perf_counter() - start, stats.get("degraded_chunks", 0)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(documents)) as executor:
+        outcomes = list(executor.map(convert, enumerate(documents)))
+    wall = time.perf_counter() - start
+
+    latencies = sorted(seconds for seconds, _ in outcomes)
+    chunks = sum(-(-len(text) // chunk_size) for text in documents)
+    return {
+        "chunk_size": chunk_size,
+        "max_concurrent_calls": concurrency,
+        "throughput_chars_per_second": round(sum(len(text) for text in documents) / wall, 1),
+        "p50_seconds": round(latencies[len(latencies) // 2], 3),
+        "p95_seconds": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3),
+        "error_rate": round(sum(degraded for _, degraded in outcomes) / chunks, 4),
+    }
+
+
+def pick_best(results, latency_target, error_budget, tie_tolerance=0.05):
+    # Settings within tie_tolerance of the best throughput count as a tie,
+    # which goes to the lowest concurrency (then the highest throughput).
+    feasible = [
+        r for r in results
+        if r["p95_seconds"] <= latency_target and r["error_rate"] <= error_budget
+    ]
+    if not feasible:
+        return None
+    best = max(r["throughput_chars_per_second"] for r in feasible)
+    ties = [r for r in feasible if r["throughput_chars_per_second"] >= best * (1 - tie_tolerance)]
+    return min(ties, key=lambda r: (r["max_concurrent_calls"], -r["throughput_chars_per_second"]))
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Tune chunk size and model-call concurrency")
+    parser.add_argument("documents", nargs="*", help="representative documents (default: built-in samples)")
+    parser.add_argument("--chunk-sizes", default="1000,2000,3000,5000,8000")
+    parser.add_argument("--concurrency", default="1,2,4,8,16")
+    parser.add_argument("--latency-target", type=float, default=30.0,
+                        help="maximum p95 seconds to convert one document")
+    parser.add_argument("--error-budget", type=float, default=0.01,
+                        help="maximum fraction of chunks that may fall back to the local conversion")
+    parser.add_argument("--tie-tolerance", type=float, default=0.05,
+                        help="throughput within this fraction of the best counts as a tie, won by lower concurrency")
+    parser.add_argument("--stub", action="store_true", help="tune against the local stub model")
+    parser.add_argument("--stub-latency", type=float, default=0.5, help="stub seconds per call")
+    parser.add_argument("--stub-latency-per-char", type=float, default=0.0002, help="stub seconds per input character")
+    parser.add_argument("--output", help=f"config file to write (default: {converter.CONFIG_PATH}; required with --stub)")
+    args = parser.parse_args()
+
+    # Stub numbers say nothing about the real model, so never let them
+    # silently replace the config the app, API and pipeline load
+    stub = args.stub or os.getenv("MATH_ENHANCER_MODEL") == "stub"
+    if stub and not args.output:
+        parser.error("--stub needs an explicit --output so the app's config is not overwritten")
+    output = args.output or converter.CONFIG_PATH
+    make_model = converter.build_model
+    if args.stub:
+        make_model = partial(converter.StubModel, args.stub_latency, args.stub_latency_per_char)
+    if args.documents:
+        documents = []
+        for path in args.documents:
+            with open(path, encoding="utf-8") as f:
+                documents.append(f.read())
+    else:
+        documents = sample_documents()
+
+    # The same sessions for every trial, enough to keep the highest cap busy
+    concurrencies = [int(v) for v in args.concurrency.split(",")]
+    documents = replicate(documents, max(concurrencies))
+
+    results = []
+    for chunk_size in [int(v) for v in args.chunk_sizes.split(",")]:
+        for concurrency in concurrencies:
+            result = run_trial(documents, chunk_size, concurrency, make_model)
+            results.append(result)
+            print(
+                f"chunk_size={chunk_size:>6} concurrency={concurrency:>3}  "
+                f"{result['throughput_chars_per_second']:>10.1f} chars/s  "
+                f"p50={result['p50_seconds']:.2f}s p95={result['p95_seconds']:.2f}s  "
+                f"errors={result['error_rate']:.2%}"
+            )
+
+    best = pick_best(results, args.latency_target, args.error_budget, args.tie_tolerance)
+    if best is None:
+        raise SystemExit("No setting met the latency target and error budget; config left unchanged.")
+    settings = {
+        "chunk_size": best["chunk_size"],
+        "max_concurrent_calls": best["max_concurrent_calls"],
+        "tuned": {
+            "model": "stub" if stub else "gemini-1.5-flash",
+            "latency_target_seconds": args.latency_target,
+            "error_budget": args.error_budget,
+            "tie_tolerance": args.tie_tolerance,
+            "result": best,
+        },
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(settings, f, indent=2)
+        f.write("\n")
+    print(f"Best: chunk_size={best['chunk_size']} max_concurrent_calls={best['max_concurrent_calls']} -> {output}")
+
+
+if __name__ == "__main__":
+    main()